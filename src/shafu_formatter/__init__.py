@@ -1,3 +1,3 @@
-from .formatter import format_solidity
+from .formatter import format_solidity, format_solidity_many
 
-__all__ = ["format_solidity"]
+__all__ = ["format_solidity", "format_solidity_many"]
@@ -1,46 +1,190 @@
+import hashlib
 import subprocess
 import tempfile
-import os
 import re
-from typing import List, Tuple, Callable, Optional
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple, Callable, Optional
 
 # Precompiled regex patterns
 IMPORT_PATTERN = re.compile(r"^(\s*import\s+.+?)\s+from\s+(.+)$")
 VAR_PATTERN = re.compile(
     r"^\s*(uint\d*|address|bool|bytes\d*|string)\s+(public|private|internal)\s+"
 )
+# Parameter list whose parameters may hold one level of parentheses, such
+# as function types, so the capture ends at the list's own closing ")"
+FUNC_PARAMS_REGEX = r"\(((?:[^()]|\([^()]*\))*)\)"
+# Only matches when a visibility keyword follows the parameter list
 SINGLE_LINE_FUNC_PATTERN = re.compile(
-    r"^(\s*function\s+\w+)\(([^)]*)\)\s*(.+?)\s*\{?\s*$"
+    rf"^(\s*function\s+\w+){FUNC_PARAMS_REGEX}\s*"
+    r"(?=.*?\b(?:external|public|private|internal)\b)(.+?)\s*\{?\s*$"
 )
-FUNC_SIG_PATTERN = re.compile(r"^(\s*function\s+\w+)\(([^)]*)\)\s*$")
+FUNC_SIG_PATTERN = re.compile(rf"^(\s*function\s+\w+){FUNC_PARAMS_REGEX}\s*$")
 CONSTRUCTOR_PATTERN = re.compile(r"^(\s*constructor)\(([^)]*)\)\s*(.*)$")
+# Line kinds shared by the passes that run once the line count is final
+LINE_CODE = 0
+LINE_COMMENT = 1
+LINE_REQUIRE = 2
+LINE_NO_ASSIGNMENT = 3  # mentions pragma, import or require( anywhere
+LINE_KIND_PATTERN = re.compile(
+    r"\s*(?:(?P<comment>//)|(?P<require>require\()"
+    r"|(?P<no_assignment>.*?(?:pragma|import|require\()))?"
+)
+LINE_KINDS_BY_GROUP = {
+    "comment": LINE_COMMENT,
+    "require": LINE_REQUIRE,
+    "no_assignment": LINE_NO_ASSIGNMENT,
+}
+BRACE_PATTERN = re.compile(r"\) \{$", re.MULTILINE)
+# Both start with a literal so re can jump straight to candidates; the
+# lookbehind is the left word boundary, checked only after "uint256" matched
+UINT256_PATTERN = re.compile(r"uint256\b(?<!\wuint256)")
+COMMENTED_UINT256_PATTERN = re.compile(r"//.*uint256")
+
+# Keyword tables shared across formatting passes
+DATA_LOCATIONS = ("storage", "memory", "calldata")
+# Longest first so that "<=" is not split into "<" and "="
+REQUIRE_OPERATORS = ("<=", ">=", "==", "!=", "<", ">", "&&", "||")
+REQUIRE_OPERATOR_PATTERN = re.compile(
+    "|".join(re.escape(op) for op in REQUIRE_OPERATORS)
+)
+STRING_LITERAL_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+PAREN_PATTERN = re.compile(r"[()]")
+ARGUMENT_SEPARATOR_PATTERN = re.compile(r"[(),]")
+# Text before the first "{" ends with "(" or contains "= " once stripped
+STRUCT_OPEN_PATTERN = re.compile(r"[^{]*(?:\(\s*|= [^{]*?[^\s{][^{]*)\{")
+# Indent, name, value and trailing comma of a "name: value," field line
+STRUCT_FIELD_PATTERN = re.compile(r"(\s*)(.*?)\s*:\s*(.*?)\s*(,?)\s*$")
+# A lone "=", not part of "==", "!=", "<=", ">=", "=>" or a compound "+=" etc.
+ASSIGNMENT_PATTERN = re.compile(r"(?<![=!<>+\-*/%|&^])=(?![=>])")
 
+# Cheap prefixes checked before running the corresponding regex
+IMPORT_PREFIXES = ("import",)
+VAR_TYPE_PREFIXES = ("uint", "address", "bool", "bytes", "string")
 
-def run_forge_fmt(code: str) -> str:
-    """Run forge fmt as a foundation, return original code on failure"""
+# (prefixes, pattern, format_func, filter_func) used to align matching lines
+AlignmentRule = Tuple[
+    Tuple[str, ...],
+    re.Pattern,
+    Callable[[str, re.Match, int], str],
+    Optional[Callable[[str], bool]],
+]
+
+
+# forge fmt output keyed by a digest of its input, oldest entries evicted first
+FORGE_CACHE_SIZE = 128
+FORGE_CACHE: "OrderedDict[bytes, str]" = OrderedDict()
+
+
+def forge_cache_key(code: str) -> bytes:
+    """Digest used to look up forge fmt output for a source"""
+    return hashlib.blake2b(code.encode(), digest_size=16).digest()
+
+
+def cache_forge_output(key: bytes, formatted_code: str) -> None:
+    """Store forge fmt output, evicting the least recently used entry"""
+    FORGE_CACHE[key] = formatted_code
+    if len(FORGE_CACHE) > FORGE_CACHE_SIZE:
+        FORGE_CACHE.popitem(last=False)
+
+
+def spawn_forge_fmt(code: str) -> Optional[str]:
+    """Run a single forge fmt process over code, None on failure"""
     try:
-        with tempfile.NamedTemporaryFile(
-            mode="w", suffix=".sol", delete=False
-        ) as temp_file:
-            temp_file.write(code)
-            temp_file_path = temp_file.name
-
-        subprocess.run(
-            ["forge", "fmt", temp_file_path],
+        # "-" reads the source from stdin, --raw prints the formatted code
+        process = subprocess.run(
+            ["forge", "fmt", "--raw", "-"],
+            input=code,
             capture_output=True,
             text=True,
             check=True,
         )
 
-        with open(temp_file_path, "r") as temp_file:
-            formatted_code = temp_file.read()
+    except (subprocess.CalledProcessError, FileNotFoundError, Exception):
+        return None
 
-        os.unlink(temp_file_path)
-        return formatted_code
+    return process.stdout
 
-    except (subprocess.CalledProcessError, FileNotFoundError, Exception):
+
+def run_forge_fmt(code: str) -> str:
+    """Run forge fmt as a foundation, return original code on failure"""
+    key = forge_cache_key(code)
+    cached = FORGE_CACHE.get(key)
+    if cached is not None:
+        FORGE_CACHE.move_to_end(key)
+        return cached
+
+    formatted_code = spawn_forge_fmt(code)
+    if formatted_code is None:
         return code
 
+    # Only successful runs are cached so a later forge install is picked up
+    cache_forge_output(key, formatted_code)
+    return formatted_code
+
+
+def run_forge_fmt_many(codes: List[str]) -> List[str]:
+    """Run forge fmt once over a batch of sources, falling back per source"""
+    keys = [forge_cache_key(code) for code in codes]
+    results = [FORGE_CACHE.get(key) for key in keys]
+    missing = [idx for idx, result in enumerate(results) if result is None]
+
+    if len(missing) > 1:
+        try:
+            # One forge process formats every uncached source in place
+            with tempfile.TemporaryDirectory() as temp_dir:
+                paths = [Path(temp_dir) / f"{idx}.sol" for idx in missing]
+                for idx, path in zip(missing, paths):
+                    path.write_text(codes[idx])
+
+                subprocess.run(
+                    ["forge", "fmt", *map(str, paths)],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+
+                for idx, path in zip(missing, paths):
+                    results[idx] = path.read_text()
+                    cache_forge_output(keys[idx], results[idx])
+
+        except (subprocess.CalledProcessError, FileNotFoundError, Exception):
+            pass
+
+    # Anything still missing is formatted on its own, with the forge
+    # processes running concurrently since each thread just waits on one
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    if len(missing) > 1:
+        with ThreadPoolExecutor() as pool:
+            spawned = pool.map(spawn_forge_fmt, [codes[idx] for idx in missing])
+            for idx, formatted_code in zip(missing, spawned):
+                if formatted_code is not None:
+                    cache_forge_output(keys[idx], formatted_code)
+                else:
+                    # forge already failed on this source, keep it unformatted
+                    formatted_code = codes[idx]
+                results[idx] = formatted_code
+
+    return [
+        result if result is not None else run_forge_fmt(code)
+        for code, result in zip(codes, results)
+    ]
+
+
+def classify_lines(lines: List[str]) -> List[int]:
+    """Classify every line with a single regex match per line"""
+    match_kind = LINE_KIND_PATTERN.match
+    kind_of_group = LINE_KINDS_BY_GROUP.get
+    # Lines matching none of the groups have no lastgroup and are plain code
+    return [kind_of_group(match_kind(line).lastgroup, LINE_CODE) for line in lines]
+
+
+def get_indent(line: str) -> str:
+    """Return the leading whitespace of a line"""
+    return line[: len(line) - len(line.lstrip())]
+
 
 def preserve_trailing_newline(original: str, formatted: str) -> str:
     """Preserve original trailing newline behavior"""
@@ -51,147 +195,241 @@ def preserve_trailing_newline(original: str, formatted: str) -> str:
     return formatted
 
 
+@lru_cache(maxsize=None)
+def compile_rule_classifier(
+    rules: Tuple[AlignmentRule, ...],
+) -> Tuple[Tuple[str, ...], re.Pattern]:
+    """Combine the rule prefixes, and the rule patterns into one alternation"""
+    all_prefixes = tuple(prefix for rule in rules for prefix in rule[0])
+    classifier = re.compile(
+        "|".join(
+            f"(?P<rule{rule_idx}>{pattern.pattern})"
+            for rule_idx, (_, pattern, _, _) in enumerate(rules)
+        )
+    )
+    return all_prefixes, classifier
+
+
+class Block(NamedTuple):
+    """A run of consecutive lines matched by the same alignment rule"""
+
+    start: int
+    rule_idx: int
+    rows: List[str]
+
+
 def find_consecutive_matching_lines(
     lines: List[str],
-    pattern: re.Pattern,
-    filter_func: Optional[Callable[[str], bool]] = None,
-) -> List[List[int]]:
-    """Find groups of consecutive lines matching a pattern"""
-    matching_lines = []
+    rules: List[AlignmentRule],
+) -> List[Block]:
+    """Find blocks of consecutive lines matching the same rule in a single scan"""
+    all_prefixes, classifier = compile_rule_classifier(tuple(rules))
+
+    # Runs are tracked while scanning, so no intermediate match list is built
+    blocks = []
+    match_line = classifier.match
+    run_start = -1
+    run_end = -1
+    run_rule = -1
+
     for line_idx, line in enumerate(lines):
-        if pattern.match(line) and (filter_func is None or filter_func(line)):
-            matching_lines.append(line_idx)
+        if not line.lstrip().startswith(all_prefixes):
+            continue
 
-    # Group consecutive lines
-    groups = []
-    current_group = []
+        match = match_line(line)
+        if not match:
+            continue
 
-    for line_idx in matching_lines:
-        if not current_group or line_idx == current_group[-1] + 1:
-            current_group.append(line_idx)
-        else:
-            if len(current_group) > 1:
-                groups.append(current_group)
-            current_group = [line_idx]
+        rule_idx = int(match.lastgroup[len("rule") :])
+        filter_func = rules[rule_idx][3]
+        if filter_func is not None and not filter_func(line):
+            continue
 
-    if len(current_group) > 1:
-        groups.append(current_group)
+        if line_idx == run_end and rule_idx == run_rule:
+            run_end += 1
+            continue
 
-    return groups
+        # The current line starts a new run; flush the previous one
+        if run_end - run_start > 1:
+            blocks.append(Block(run_start, run_rule, lines[run_start:run_end]))
+        run_start = line_idx
+        run_end = line_idx + 1
+        run_rule = rule_idx
+
+    if run_end - run_start > 1:
+        blocks.append(Block(run_start, run_rule, lines[run_start:run_end]))
+
+    return blocks
+
+
+def align_block(block: Block, rules: List[AlignmentRule]) -> List[str]:
+    """Format the rows of a single block, independent of the rest of the file"""
+    _, pattern, format_func, _ = rules[block.rule_idx]
+
+    # Parallel lists: every row in the block is known to match
+    matches = [pattern.match(row) for row in block.rows]
+    captures = [match.group(1) for match in matches]
+
+    # This will be overridden by specific format_func logic
+    max_length = max(map(len, captures))
+
+    return [
+        format_func(row, match, max_length)
+        for row, match in zip(block.rows, matches)
+    ]
 
 
 def align_by_capture_groups(
     lines: List[str],
-    pattern: re.Pattern,
-    format_func: Callable[[str, re.Match, int], str],
-    filter_func: Optional[Callable[[str], bool]] = None,
+    rules: List[AlignmentRule],
 ) -> List[str]:
     """Generic helper to align consecutive lines by capture groups"""
-    result = lines.copy()
-    groups = find_consecutive_matching_lines(lines, pattern, filter_func)
+    blocks = find_consecutive_matching_lines(lines, rules)
 
-    for group in groups:
-        if len(group) <= 1:
-            continue
+    # Blocks are ordered and disjoint, so the output is built front to back
+    out = []
+    cursor = 0
 
-        # Calculate max length for alignment
-        max_length = 0
-        group_matches = []
+    for block in blocks:
+        out.extend(lines[cursor : block.start])
+        out.extend(align_block(block, rules))
+        cursor = block.start + len(block.rows)
 
-        for line_idx in group:
-            line = lines[line_idx]
-            match = pattern.match(line)
-            if match:
-                group_matches.append((line_idx, match))
-                # This will be overridden by specific format_func logic
-                max_length = max(max_length, len(match.group(1)))
+    out.extend(lines[cursor:])
+    return out
 
-        # Apply formatting
-        for line_idx, match in group_matches:
-            result[line_idx] = format_func(lines[line_idx], match, max_length)
 
-    return result
+def convert_uint256_to_uint(code: str) -> str:
+    """Convert uint256 to uint for shorter syntax, skipping comment lines"""
+    # Plain substring search is far cheaper than running the regex
+    if "uint256" not in code:
+        return code
 
+    # Convert the stretches between comment lines that mention uint256
+    parts = []
+    cursor = 0
 
-def convert_uint256_to_uint(lines: List[str]) -> List[str]:
-    """Convert uint256 to uint for shorter syntax"""
-    return [
-        line.replace("uint256", "uint") if not line.strip().startswith("//") else line
-        for line in lines
-    ]
+    for match in COMMENTED_UINT256_PATTERN.finditer(code):
+        line_start = code.rfind("\n", 0, match.start()) + 1
+        if code[line_start : match.start()].strip():
+            continue  # A trailing comment after code is converted with it
 
+        line_end = code.find("\n", match.end())
+        if line_end == -1:
+            line_end = len(code)
 
-def format_import_statements(lines: List[str]) -> List[str]:
-    """Format and align import statements"""
+        parts.append(UINT256_PATTERN.sub("uint", code[cursor:line_start]))
+        parts.append(code[line_start:line_end])
+        cursor = line_end
 
-    def format_import(line: str, match: re.Match, max_length: int) -> str:
-        import_part = match.group(1).strip()
-        from_part = match.group(2).strip()
-        indent = line[: len(line) - len(line.lstrip())]
+    parts.append(UINT256_PATTERN.sub("uint", code[cursor:]))
+    return "".join(parts)
 
-        padding_needed = max_length - len(import_part)
-        padding = " " * (padding_needed + 1)  # +1 for separation
 
-        return f"{indent}{import_part}{padding}from {from_part}"
+def format_import(line: str, match: re.Match, max_length: int) -> str:
+    """Pad an import statement so its from clause lines up with the group"""
+    import_part = match.group(1).strip()
+    from_part = match.group(2).strip()
+    indent = get_indent(line)
 
-    return align_by_capture_groups(lines, IMPORT_PATTERN, format_import)
+    # +1 for separation
+    return f"{indent}{import_part.ljust(max_length + 1)}from {from_part}"
 
 
-def format_variable_declarations(lines: List[str]) -> List[str]:
-    """Format and align variable declarations"""
+def format_var(line: str, match: re.Match, max_length: int) -> str:
+    """Pad a variable declaration so its visibility lines up with the group"""
+    type_name = match.group(1)
+    padding_needed = max_length - len(type_name)
 
-    def format_var(line: str, match: re.Match, max_length: int) -> str:
-        type_name = match.group(1)
-        padding_needed = max_length - len(type_name)
-        padding = " " * padding_needed
+    # Already aligned: single spaces around the visibility and no padding
+    if (
+        padding_needed == 0
+        and line[match.end(1) : match.start(2)] == " "
+        and line[match.end(2) : match.end()] == " "
+    ):
+        return line
 
-        return VAR_PATTERN.sub(
-            lambda m: f"{line[: m.start(1)]}{m.group(1)}{padding} {m.group(2)} ",
-            line,
-            count=1,
-        )
+    # Splice around the existing match instead of running the regex again
+    return (
+        f"{line[: match.start(1)]}{type_name.ljust(max_length)} {match.group(2)} "
+        f"{line[match.end() :]}"
+    )
+
+
+DECLARATION_RULES: List[AlignmentRule] = [
+    (IMPORT_PREFIXES, IMPORT_PATTERN, format_import, None),
+    # A line starting with a type prefix can never be a // comment
+    (VAR_TYPE_PREFIXES, VAR_PATTERN, format_var, None),
+]
 
-    filter_func = lambda line: not line.strip().startswith("//")
-    return align_by_capture_groups(lines, VAR_PATTERN, format_var, filter_func)
+
+def format_declarations(lines: List[str]) -> List[str]:
+    """Format and align import statements and variable declarations"""
+    return align_by_capture_groups(lines, DECLARATION_RULES)
 
 
 def format_function_declarations(lines: List[str]) -> List[str]:
     """Format function declarations with proper multiline style"""
-    result = lines.copy()
-    i = 0
+    # First pass: plan the rewrites so the output size is known up front
+    rewrites = []
+    extra_lines = 0
 
-    while i < len(result):
-        line = result[i]
+    for i, line in enumerate(lines):
+        # Only lines mentioning "function" can match either pattern
+        if "function" not in line:
+            continue
+
+        new_lines = None
 
         # Pattern 1: Single-line function with visibility
         match = SINGLE_LINE_FUNC_PATTERN.match(line)
-        if match and any(
-            vis in match.group(3)
-            for vis in ["external", "public", "private", "internal"]
-        ):
+        if match:
             new_lines = convert_function_to_multiline(line, match)
-            result[i : i + 1] = new_lines
-            i += len(new_lines)
-            continue
+        else:
+            # Pattern 2: Function signature with parameters on same line
+            match = FUNC_SIG_PATTERN.match(line)
+            if match:
+                if len(split_params(match.group(2))) > 2:
+                    new_lines = reformat_function_parameters(line, match)
+
+        if new_lines is not None:
+            rewrites.append((i, new_lines))
+            extra_lines += len(new_lines) - 1
+
+    if not rewrites:
+        return lines.copy()
+
+    # Second pass: fill a list preallocated to the exact output size
+    result = [""] * (len(lines) + extra_lines)
+    out_idx = 0
+    cursor = 0
+
+    for line_idx, new_lines in rewrites:
+        unchanged = line_idx - cursor
+        result[out_idx : out_idx + unchanged] = lines[cursor:line_idx]
+        out_idx += unchanged
+        result[out_idx : out_idx + len(new_lines)] = new_lines
+        out_idx += len(new_lines)
+        cursor = line_idx + 1
+
+    result[out_idx:] = lines[cursor:]
+    return result
 
-        # Pattern 2: Function signature with parameters on same line
-        match = FUNC_SIG_PATTERN.match(line)
-        if match:
-            params_str = match.group(2).strip()
-            params = (
-                [p.strip() for p in params_str.split(",") if p.strip()]
-                if params_str
-                else []
-            )
-            if len(params) > 2:
-                new_lines = reformat_function_parameters(line, match)
-                result[i : i + 1] = new_lines
-                i += len(new_lines)
-                continue
 
-        i += 1
+def split_params(params_str: str) -> List[str]:
+    """Split a parameter list at its top-level commas, dropping empty entries"""
+    # Without parentheses every comma separates two parameters
+    if "(" not in params_str:
+        return [param.strip() for param in params_str.split(",") if param.strip()]
 
-    return result
+    params = []
+    start = 0
+    for end in find_top_level_commas(params_str) + [len(params_str)]:
+        param = params_str[start:end].strip()
+        if param:
+            params.append(param)
+        start = end + 1
+    return params
 
 
 def convert_function_to_multiline(line: str, match: re.Match) -> List[str]:
@@ -203,12 +441,10 @@ def convert_function_to_multiline(line: str, match: re.Match) -> List[str]:
     if after_params.endswith("{"):
         after_params = after_params[:-1].strip()
 
-    indent = line[: len(line) - len(line.lstrip())]
+    indent = get_indent(line)
     new_lines = []
 
-    params = (
-        [p.strip() for p in params_str.split(",") if p.strip()] if params_str else []
-    )
+    params = split_params(params_str)
 
     if len(params) > 2:
         new_lines.append(f"{func_name_part}(")
@@ -235,8 +471,8 @@ def reformat_function_parameters(line: str, match: re.Match) -> List[str]:
     func_name_part = match.group(1)
     params_str = match.group(2).strip()
 
-    params = [p.strip() for p in params_str.split(",") if p.strip()]
-    indent = line[: len(line) - len(line.lstrip())]
+    params = split_params(params_str)
+    indent = get_indent(line)
 
     new_lines = [f"{func_name_part}("]
 
@@ -252,24 +488,24 @@ def reformat_function_parameters(line: str, match: re.Match) -> List[str]:
 
 def format_constructors(lines: List[str]) -> List[str]:
     """Format constructor declarations with aligned parameters"""
-    result = lines.copy()
+    # Build the output in one forward pass instead of splicing into a copy
+    result = []
     i = 0
 
-    while i < len(result):
-        line = result[i]
+    while i < len(lines):
+        line = lines[i]
 
         # Check if this is a constructor line
-        if "constructor(" in line and not line.strip().startswith("//"):
+        if "constructor(" in line and not line.lstrip().startswith("//"):
             # Find the constructor declaration and its parameters
-            constructor_start = i
             constructor_lines = []
 
             # Collect all lines of the constructor declaration
             j = i
-            while j < len(result):
-                constructor_lines.append(result[j])
+            while j < len(lines):
+                constructor_lines.append(lines[j])
                 # Check if this line ends the parameter list
-                if ")" in result[j]:
+                if ")" in lines[j]:
                     break
                 j += 1
 
@@ -278,9 +514,7 @@ def format_constructors(lines: List[str]) -> List[str]:
                 # Parse the last line to separate ) and {
                 last_line = constructor_lines[-1]
                 last_line_stripped = last_line.strip()
-                indent = constructor_lines[0][
-                    : len(constructor_lines[0]) - len(constructor_lines[0].lstrip())
-                ]
+                indent = get_indent(constructor_lines[0])
 
                 # Check if ) and { are on the same line
                 extra_after_paren = ""
@@ -324,11 +558,7 @@ def format_constructors(lines: List[str]) -> List[str]:
                     parts = param.split()
                     if len(parts) >= 2:
                         # Handle array types like "address[] memory"
-                        if (
-                            "memory" in parts
-                            or "storage" in parts
-                            or "calldata" in parts
-                        ):
+                        if any(location in parts for location in DATA_LOCATIONS):
                             type_part = " ".join(parts[:-2])
                             memory_part = parts[-2]
                             name_part = parts[-1]
@@ -338,10 +568,8 @@ def format_constructors(lines: List[str]) -> List[str]:
                                 max_modifier_length, len(memory_part)
                             )
                         else:
+                            # uint256 was already shortened over the whole source
                             type_part = parts[0]
-                            # Handle uint256 -> uint conversion
-                            if type_part == "uint256":
-                                type_part = "uint"
                             name_part = " ".join(parts[1:])
                             param_parts.append((type_part, None, name_part))
                             max_type_length = max(max_type_length, len(type_part))
@@ -352,17 +580,14 @@ def format_constructors(lines: List[str]) -> List[str]:
                 for idx, (type_part, memory_part, name_part) in enumerate(param_parts):
                     if memory_part:
                         # For params with memory/storage/calldata
-                        type_padding = " " * (max_type_length - len(type_part) + 1)
-                        modifier_padding = " " * (
-                            max_modifier_length - len(memory_part) + 1
+                        aligned_param = (
+                            f"{type_part.ljust(max_type_length + 1)}"
+                            f"{memory_part.ljust(max_modifier_length + 1)}{name_part}"
                         )
-                        aligned_param = f"{type_part}{type_padding}{memory_part}{modifier_padding}{name_part}"
                     else:
                         # For simple type params - they need extra padding to account for missing modifier
-                        type_padding = " " * (
-                            max_type_length - len(type_part) + max_modifier_length + 2
-                        )
-                        aligned_param = f"{type_part}{type_padding}{name_part}"
+                        type_width = max_type_length + max_modifier_length + 2
+                        aligned_param = f"{type_part.ljust(type_width)}{name_part}"
 
                     if idx < len(param_parts) - 1:
                         new_lines.append(f"{indent}    {aligned_param},")
@@ -374,19 +599,105 @@ def format_constructors(lines: List[str]) -> List[str]:
                     extra_after_paren = "  {"
                 new_lines.append(f"{indent}){extra_after_paren}")
 
-                # Replace the old lines with new ones
-                result[
-                    constructor_start : constructor_start + len(constructor_lines)
-                ] = new_lines
-                i = constructor_start + len(new_lines)
+                # Emit the new lines in place of the old declaration
+                result.extend(new_lines)
+                i += len(constructor_lines)
                 continue
 
+        result.append(line)
         i += 1
 
     return result
 
 
-def format_require_statements(lines: List[str]) -> List[str]:
+def blank_string_literal(match: re.Match) -> str:
+    """Replace the contents of a matched string literal, keeping its quotes"""
+    literal = match.group()
+    return f"{literal[0]}{'_' * (len(literal) - 2)}{literal[-1]}"
+
+
+def mask_string_literals(text: str) -> str:
+    """Blank out string literal contents, keeping every index in place"""
+    if '"' not in text and "'" not in text:
+        return text
+    return STRING_LITERAL_PATTERN.sub(blank_string_literal, text)
+
+
+def find_assignment_operator(line: str) -> int:
+    """Find the assignment "=" outside strings and trailing comments, -1 if none"""
+    if "=" not in line:
+        return -1
+
+    masked = mask_string_literals(line)
+    comment_pos = masked.find("//")
+    end = comment_pos if comment_pos != -1 else len(masked)
+
+    match = ASSIGNMENT_PATTERN.search(masked, 0, end)
+    if not match:
+        return -1
+
+    # An assignment target never spans a block or statement boundary
+    target = masked[: match.start()]
+    if "{" in target or ";" in target:
+        return -1
+    return match.start()
+
+
+def find_closing_paren(text: str) -> int:
+    """Find the parenthesis closing the first opening one, -1 if unbalanced"""
+    paren_count = 0
+    for match in PAREN_PATTERN.finditer(text):
+        if match.group() == "(":
+            paren_count += 1
+        else:
+            paren_count -= 1
+            if paren_count == 0:
+                return match.start()
+    return -1
+
+
+def find_top_level_commas(text: str) -> List[int]:
+    """Find the positions of commas outside parentheses"""
+    positions = []
+    paren_depth = 0
+    for match in ARGUMENT_SEPARATOR_PATTERN.finditer(text):
+        char = match.group()
+        if char == "(":
+            paren_depth += 1
+        elif char == ")":
+            paren_depth -= 1
+        elif paren_depth == 0:
+            positions.append(match.start())
+    return positions
+
+
+def find_require_operator(condition: str) -> Tuple[Optional[str], int]:
+    """Find the highest priority operator outside parentheses in a condition"""
+    first_positions = {}
+    paren_depth = 0
+    scanned = 0
+
+    for match in REQUIRE_OPERATOR_PATTERN.finditer(condition):
+        start = match.start()
+        paren_depth += condition.count("(", scanned, start)
+        paren_depth -= condition.count(")", scanned, start)
+        scanned = start
+
+        op = match.group()
+        if paren_depth == 0 and op not in first_positions:
+            # Nothing later can outrank the highest priority operator
+            if op == REQUIRE_OPERATORS[0]:
+                return op, start
+            first_positions[op] = start
+
+    for op in REQUIRE_OPERATORS:
+        if op in first_positions:
+            return op, first_positions[op]
+
+    return None, -1
+
+
+def format_require_statements(lines: List[str], kinds: List[int]) -> List[str]:
     """Format require statements with aligned conditions and error messages"""
     result = lines.copy()
 
@@ -394,9 +705,8 @@ def format_require_statements(lines: List[str]) -> List[str]:
     require_groups = []
     current_group = []
 
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-        if stripped.startswith("require(") and not line.strip().startswith("//"):
+    for i, kind in enumerate(kinds):
+        if kind == LINE_REQUIRE:
             current_group.append(i)
         else:
             if len(current_group) > 1:
@@ -417,37 +727,25 @@ def format_require_statements(lines: List[str]) -> List[str]:
 
         for line_idx in group:
             line = lines[line_idx]
-            indent = line[: len(line) - len(line.lstrip())]
+            indent = get_indent(line)
             stripped = line.strip()
+            # Scan a copy with string contents blanked so that quoted
+            # commas, parens and operators are ignored
+            masked = mask_string_literals(stripped)
 
             # Extract condition and error from require statement
             if "require(" in stripped and "," in stripped:
                 # Find the matching parenthesis
-                paren_count = 0
-                condition_end = -1
-                for i, char in enumerate(stripped):
-                    if char == "(":
-                        paren_count += 1
-                    elif char == ")":
-                        paren_count -= 1
-                        if paren_count == 0:
-                            condition_end = i
-                            break
+                condition_end = find_closing_paren(masked)
 
                 if condition_end > 0:
                     # Extract the full require content
                     require_content = stripped[8:condition_end]  # Skip "require("
 
                     # Find the last comma that separates condition from error
-                    comma_positions = []
-                    paren_depth = 0
-                    for i, char in enumerate(require_content):
-                        if char == "(":
-                            paren_depth += 1
-                        elif char == ")":
-                            paren_depth -= 1
-                        elif char == "," and paren_depth == 0:
-                            comma_positions.append(i)
+                    comma_positions = find_top_level_commas(
+                        masked[8:condition_end]
+                    )
 
                     if comma_positions:
                         last_comma = comma_positions[-1]
@@ -455,31 +753,9 @@ def format_require_statements(lines: List[str]) -> List[str]:
                         error_part = require_content[last_comma + 1 :].strip()
 
                         # Parse the condition to find operators
-                        # Common operators in order of precedence (longest first to avoid splitting <=)
-                        operators = ["<=", ">=", "==", "!=", "<", ">", "&&", "||"]
-                        operator_found = None
-                        operator_pos = -1
-
-                        for op in operators:
-                            if op in condition:
-                                # Find the operator position (not inside parentheses)
-                                paren_depth = 0
-                                for i in range(len(condition) - len(op) + 1):
-                                    substring = condition[i : i + len(op)]
-                                    # Check paren depth at this position
-                                    for j in range(i):
-                                        if condition[j] == "(":
-                                            paren_depth += 1
-                                        elif condition[j] == ")":
-                                            paren_depth -= 1
-
-                                    if substring == op and paren_depth == 0:
-                                        operator_found = op
-                                        operator_pos = i
-                                        break
-
-                                if operator_found:
-                                    break
+                        operator_found, operator_pos = find_require_operator(
+                            masked[8:condition_end][:last_comma].strip()
+                        )
 
                         if operator_found and operator_pos >= 0:
                             left_part = condition[:operator_pos].strip()
@@ -524,13 +800,12 @@ def format_require_statements(lines: List[str]) -> List[str]:
             if len(data) == 6:  # Has data
                 line_idx, indent, left, op, right, error = data
 
-                # Align left side for all lines
-                left_padding = " " * (max_left_length - len(left))
-
-                # Build condition string
+                # Build condition string, aligning the left side and operator
                 if op:
-                    op_padding = " " * (max_operator_length - len(op))
-                    condition_str = f"{left}{left_padding} {op}{op_padding} {right}"
+                    condition_str = (
+                        f"{left.ljust(max_left_length)} "
+                        f"{op.ljust(max_operator_length)} {right}"
+                    )
                 else:
                     # For lines without operators, we need to leave space as if there was an operator
                     condition_str = left
@@ -539,43 +814,27 @@ def format_require_statements(lines: List[str]) -> List[str]:
                 if op:  # Only count lines with operators for max length
                     max_condition_length = max(max_condition_length, len(condition_str))
 
-        # Rebuild require statements with proper error alignment
+        # Rebuild require statements with proper error alignment; lines
+        # without operators are padded to the longest condition the same way
         for line_idx, indent, condition_str, error, op in conditions_list:
-            if op:
-                # Lines with operators - normal padding
-                padding_after_comma = " " * (max_condition_length - len(condition_str))
-                aligned_require = (
-                    f"{indent}require({condition_str},{padding_after_comma} {error});"
-                )
-            else:
-                # Lines without operators - special handling
-                # Calculate padding to align with the longest condition
-                padding_after_condition = " " * (
-                    max_condition_length - len(condition_str)
-                )
-                aligned_require = f"{indent}require({condition_str},{padding_after_condition} {error});"
-
-            result[line_idx] = aligned_require
+            condition_column = f"{condition_str},".ljust(max_condition_length + 1)
+            result[line_idx] = f"{indent}require({condition_column} {error});"
 
     return result
 
 
-def format_variable_assignments(lines: List[str]) -> List[str]:
+def format_variable_assignments(lines: List[str], kinds: List[int]) -> List[str]:
     """Format variable assignments with aligned = operators and storage/memory keywords"""
-    assignment_groups = find_assignment_groups(lines)
+    assignment_groups = find_assignment_groups(lines, kinds)
     result = lines.copy()
 
     for group in assignment_groups:
-        if len(group) <= 1:
-            continue
-
         # Separate lines with and without modifiers
         modifier_lines = []
         simple_lines = []
 
         for line_idx, parts in group:
-            var_tokens = parts[0].split()
-            if len(var_tokens) >= 3 and var_tokens[1] in ["storage", "memory", "calldata"]:
+            if split_data_location(parts[0]):
                 modifier_lines.append((line_idx, parts))
             else:
                 simple_lines.append((line_idx, parts))
@@ -592,15 +851,13 @@ def format_variable_assignments(lines: List[str]) -> List[str]:
 
                 for line_idx, parts in simple_lines:
                     var_part, value_part = parts
-                    padding_needed = max_var_length - len(var_part)
-                    padding = " " * padding_needed
 
                     original_line = lines[line_idx]
-                    indent = original_line[
-                        : len(original_line) - len(original_line.lstrip())
-                    ]
+                    indent = get_indent(original_line)
 
-                    result[line_idx] = f"{indent}{var_part}{padding} = {value_part}"
+                    result[line_idx] = (
+                        f"{indent}{var_part.ljust(max_var_length)} = {value_part}"
+                    )
         
         elif len(modifier_lines) == 1:
             # Single complex line - align simple lines with it
@@ -613,6 +870,15 @@ def format_variable_assignments(lines: List[str]) -> List[str]:
     return result
 
 
+def split_data_location(var_part: str) -> Optional[List[str]]:
+    """Split "Type location name" into its three parts, None without a location"""
+    var_tokens = var_part.split()
+    if len(var_tokens) >= 3 and var_tokens[1] in DATA_LOCATIONS:
+        # Runs of whitespace inside the name collapse to single spaces
+        return [var_tokens[0], var_tokens[1], " ".join(var_tokens[2:])]
+    return None
+
+
 def format_simple_assignments_with_arrays(group, lines, result):
     """Format simple assignments with array alignment"""
     # Parse each assignment
@@ -649,46 +915,44 @@ def format_simple_assignments_with_arrays(group, lines, result):
     
     # Use two-column alignment if we have arrays OR different types
     use_two_column = has_arrays or has_different_types
-    
+    max_var_part_length = max(
+        len(f"{tp} {vn}" if tp else vn) for _, tp, vn, _ in parsed_assignments
+    )
+
     # Rebuild with alignment
     for line_idx, type_part, var_name, value_part in parsed_assignments:
         original_line = lines[line_idx]
-        indent = original_line[: len(original_line) - len(original_line.lstrip())]
+        indent = get_indent(original_line)
 
         if use_two_column:
-            # Use two-column alignment 
-            type_padding = " " * (max_type_length - len(type_part))
-            var_padding = " " * (max_var_length - len(var_name))
-            
+            # Use two-column alignment, padding each column with ljust
             # Handle array spacing
-            if "[" in value_part and (
-                value_part.strip().endswith("]") or value_part.strip().endswith("];")
-            ):
+            # value_part is already stripped by find_assignment_groups
+            if "[" in value_part and value_part.endswith(("]", "];")):
                 bracket_pos = value_part.find("[")
                 array_name = value_part[:bracket_pos].strip()
-                array_index = value_part[bracket_pos:].strip()
+                array_index = value_part[bracket_pos:]
 
                 # Add spacing to align array names
-                array_padding = " " * (max_array_name_length - len(array_name))
-                value_part = f"{array_name}{array_padding}{array_index}"
-            
-            result[line_idx] = f"{indent}{type_part}{type_padding} {var_name}{var_padding} = {value_part}"
+                value_part = f"{array_name.ljust(max_array_name_length)}{array_index}"
+
+            result[line_idx] = (
+                f"{indent}{type_part.ljust(max_type_length)} "
+                f"{var_name.ljust(max_var_length)} = {value_part}"
+            )
         else:
             # Simple alignment without arrays and same types
             var_part_full = f"{type_part} {var_name}" if type_part else var_name
-            max_var_part_length = max(len(f"{tp} {vn}" if tp else vn) for _, tp, vn, _ in parsed_assignments)
-            padding_needed = max_var_part_length - len(var_part_full)
-            padding = " " * padding_needed
-            
-            result[line_idx] = f"{indent}{var_part_full}{padding} = {value_part}"
+            result[line_idx] = (
+                f"{indent}{var_part_full.ljust(max_var_part_length)} = {value_part}"
+            )
 
 
 def format_complex_assignments(group, lines, result):
     """Format assignments with storage/memory modifiers using three-column alignment"""
     # Check if this is a mixed group or complex-only group
     has_simple_lines = any(
-        len(parts[0].split()) < 3 or parts[0].split()[1] not in ["storage", "memory", "calldata"]
-        for line_idx, parts in group
+        not split_data_location(parts[0]) for line_idx, parts in group
     )
     
     # Parse each assignment
@@ -700,7 +964,7 @@ def format_complex_assignments(group, lines, result):
 
     for line_idx, parts in group:
         var_part, value_part = parts
-        var_tokens = var_part.split()
+        var_tokens = split_data_location(var_part)
 
         # Check for array access to find max array name length
         if "[" in value_part:
@@ -708,11 +972,9 @@ def format_complex_assignments(group, lines, result):
             array_name = value_part[:bracket_pos].strip()
             max_array_name_length = max(max_array_name_length, len(array_name))
 
-        if len(var_tokens) >= 3 and var_tokens[1] in ["storage", "memory", "calldata"]:
+        if var_tokens:
             # Has modifier
-            type_part = var_tokens[0]
-            modifier = var_tokens[1]
-            var_name = " ".join(var_tokens[2:])
+            type_part, modifier, var_name = var_tokens
             
             parsed_assignments.append((line_idx, type_part, modifier, var_name, value_part))
             max_type_length = max(max_type_length, len(type_part))
@@ -720,221 +982,228 @@ def format_complex_assignments(group, lines, result):
             max_var_length = max(max_var_length, len(var_name))
         else:
             # No modifier - simple assignment
+            var_tokens = var_part.split()
             type_part = var_tokens[0]
-            var_name = " ".join(var_tokens[1:]) if len(var_tokens) > 1 else ""
+            var_name = " ".join(var_tokens[1:])
             
             parsed_assignments.append((line_idx, type_part, None, var_name, value_part))
             max_type_length = max(max_type_length, len(type_part))
             max_var_length = max(max_var_length, len(var_name))
 
+    # Simple lines in a mixed group leave the modifier column blank,
+    # +1 for the space after the modifier
+    modifier_space = " " * (max_modifier_length + 1)
+
     # Rebuild with alignment
     for line_idx, type_part, modifier, var_name, value_part in parsed_assignments:
         original_line = lines[line_idx]
-        indent = original_line[: len(original_line) - len(original_line.lstrip())]
+        indent = get_indent(original_line)
 
         if modifier:
             # Use three column alignment for lines with modifiers
-            type_padding = " " * (max_type_length - len(type_part))
-            modifier_padding = " " * (max_modifier_length - len(modifier))
-            var_padding = " " * (max_var_length - len(var_name))
 
             # Special handling for array access in value
-            if "[" in value_part and (
-                value_part.strip().endswith("]") or value_part.strip().endswith("];")
-            ):
+            # value_part is already stripped by find_assignment_groups
+            if "[" in value_part and value_part.endswith(("]", "];")):
                 bracket_pos = value_part.find("[")
                 array_name = value_part[:bracket_pos].strip()
-                array_index = value_part[bracket_pos:].strip()
+                array_index = value_part[bracket_pos:]
 
                 # Add spacing to align array names
-                array_padding = " " * (max_array_name_length - len(array_name))
-                value_part = f"{array_name}{array_padding}{array_index}"
+                value_part = f"{array_name.ljust(max_array_name_length)}{array_index}"
 
             result[line_idx] = (
-                f"{indent}{type_part}{type_padding} {modifier}{modifier_padding} {var_name}{var_padding} = {value_part}"
+                f"{indent}{type_part.ljust(max_type_length)} "
+                f"{modifier.ljust(max_modifier_length)} "
+                f"{var_name.ljust(max_var_length)} = {value_part}"
             )
         else:
             # Simple line - only align with complex lines if this is a mixed group
             if has_simple_lines and max_modifier_length > 0:
                 # Mixed group - use three-column style alignment for simple lines
-                type_padding = " " * (max_type_length - len(type_part))
-                # Use modifier space for padding
-                modifier_space = " " * (max_modifier_length + 1)  # +1 for space after modifier
-                var_padding = " " * (max_var_length - len(var_name))
-                
-                result[line_idx] = f"{indent}{type_part}{type_padding} {modifier_space}{var_name}{var_padding} = {value_part}"
+                result[line_idx] = (
+                    f"{indent}{type_part.ljust(max_type_length)} {modifier_space}"
+                    f"{var_name.ljust(max_var_length)} = {value_part}"
+                )
             else:
                 # This shouldn't happen with current logic, but fallback to simple
                 result[line_idx] = f"{indent}{type_part} {var_name} = {value_part}"
 
 
-def find_assignment_groups(lines: List[str]) -> List[List[Tuple[int, Tuple[str, str]]]]:
-    """Find consecutive groups of assignment statements"""
+def find_assignment_groups(
+    lines: List[str], kinds: List[int]
+) -> List[List[Tuple[int, Tuple[str, str]]]]:
+    """Find runs of two or more consecutive assignment statements"""
     groups = []
     current_group = []
 
     for i, line in enumerate(lines):
-        stripped = line.strip()
-
-        if (
-            "=" in stripped
-            and not stripped.startswith("//")
-            and "pragma" not in stripped
-            and "import" not in stripped
-            and "require(" not in stripped
-        ):
-            parts = stripped.split("=", 1)
-            if len(parts) == 2:
-                var_part = parts[0].strip()
-                value_part = parts[1].strip()
-                if not any(op in var_part for op in ["==", "!=", "<=", ">="]):
-                    current_group.append((i, (var_part, value_part)))
-                    continue
+        # Comments, pragmas, imports and requires are never assignments
+        if kinds[i] == LINE_CODE:
+            # Comparisons and "=" inside strings or comments are not assignments
+            eq_idx = find_assignment_operator(line)
+            if eq_idx != -1:
+                var_part = line[:eq_idx].strip()
+                value_part = line[eq_idx + 1 :].strip()
+                current_group.append((i, (var_part, value_part)))
+                continue
 
-        if current_group:
+        # A lone assignment has nothing to align with
+        if len(current_group) > 1:
             groups.append(current_group)
+        if current_group:
             current_group = []
 
-    if current_group:
+    if len(current_group) > 1:
         groups.append(current_group)
 
     return groups
 
 
-def format_struct_assignments(lines: List[str]) -> List[str]:
+def format_struct_assignments(lines: List[str], kinds: List[int]) -> List[str]:
     """Format struct field assignments with aligned colons"""
     result = lines.copy()
-    i = 0
+    # Only lines holding both "{" and "(" can open a struct literal
+    candidates = [i for i, line in enumerate(lines) if "{" in line and "(" in line]
+    next_free = 0
 
-    while i < len(result):
+    for i in candidates:
         line = result[i]
 
-        # Look for lines that might start a struct initialization
-        if "{" in line and "(" in line and not line.strip().startswith("//"):
-            # Find the opening brace
-            brace_pos = line.find("{")
-            if brace_pos > 0:
-                # Check if this looks like a struct initialization
-                before_brace = line[:brace_pos].strip()
-                if before_brace.endswith("(") or "= " in before_brace:
-                    # Collect all lines of the struct
-                    struct_lines = []
-                    struct_start = i
-                    j = i
-
-                    # Find all lines until the closing brace
-                    brace_count = 0
-                    while j < len(result):
-                        current_line = result[j]
-                        struct_lines.append(j)
-
-                        # Count braces to find the end
-                        brace_count += current_line.count("{") - current_line.count("}")
-
-                        if brace_count == 0 and "}" in current_line:
-                            break
-                        j += 1
-
-                    # Process struct fields
-                    if (
-                        len(struct_lines) > 2
-                    ):  # At least opening, one field, and closing
-                        field_data = []
-                        max_field_name_length = 0
-
-                        # Parse each field line
-                        for line_idx in struct_lines[1:-1]:  # Skip first and last lines
-                            field_line = result[line_idx]
-                            stripped = field_line.strip()
-
-                            # Skip empty lines and comments
-                            if not stripped or stripped.startswith("//"):
-                                continue
-
-                            # Look for field assignments (field: value)
-                            if ":" in stripped:
-                                colon_pos = stripped.find(":")
-                                field_name = stripped[:colon_pos].strip()
-                                field_value = stripped[colon_pos + 1 :].strip()
-
-                                # Remove trailing comma if present
-                                if field_value.endswith(","):
-                                    has_comma = True
-                                    field_value = field_value[:-1].strip()
-                                else:
-                                    has_comma = False
-
-                                field_data.append(
-                                    (line_idx, field_name, field_value, has_comma)
-                                )
-                                max_field_name_length = max(
-                                    max_field_name_length, len(field_name)
-                                )
+        # Look for lines that might start a struct initialization, skipping
+        # candidates inside a literal that was already handled
+        if (
+            i >= next_free
+            and kinds[i] != LINE_COMMENT
+            and STRUCT_OPEN_PATTERN.match(line)
+        ):
+            # Collect all lines of the struct
+            struct_lines = []
+            j = i
 
-                        # Rebuild struct with aligned fields
-                        if field_data:
-                            for (
-                                line_idx,
-                                field_name,
-                                field_value,
-                                has_comma,
-                            ) in field_data:
-                                indent = result[line_idx][
-                                    : len(result[line_idx])
-                                    - len(result[line_idx].lstrip())
-                                ]
-                                padding = " " * (
-                                    max_field_name_length - len(field_name)
-                                )
-                                comma = "," if has_comma else ""
-                                result[line_idx] = (
-                                    f"{indent}{field_name}:{padding} {field_value}{comma}"
-                                )
+            # Find all lines until the closing brace
+            brace_count = 0
+            while j < len(result):
+                current_line = result[j]
+                struct_lines.append(j)
 
-                    i = j + 1
-                    continue
+                # Count braces to find the end, reusing the close count
+                closes = current_line.count("}")
+                brace_count += current_line.count("{") - closes
 
-        i += 1
+                if brace_count == 0 and closes:
+                    break
+                j += 1
+
+            # Process struct fields
+            if (
+                len(struct_lines) > 2
+            ):  # At least opening, one field, and closing
+                field_data = []
+
+                # Parse each field line
+                for line_idx in struct_lines[1:-1]:  # Skip first and last lines
+                    # Skip comments
+                    if kinds[line_idx] == LINE_COMMENT:
+                        continue
+
+                    # Look for field assignments (field: value), which also
+                    # skips empty lines
+                    match = STRUCT_FIELD_PATTERN.match(result[line_idx])
+                    if match:
+                        # indent, name, value and "," or ""
+                        field_data.append((line_idx, *match.groups()))
+
+                # Rebuild struct with aligned fields
+                if field_data:
+                    # Widest name, taken once every field is known
+                    max_field_name_length = max(len(field[2]) for field in field_data)
+
+                    for line_idx, indent, field_name, field_value, comma in field_data:
+                        name_column = f"{field_name}:".ljust(max_field_name_length + 1)
+                        result[line_idx] = f"{indent}{name_column} {field_value}{comma}"
+
+            next_free = j + 1
 
     return result
 
 
-def add_double_space_before_brace(lines: List[str]) -> List[str]:
+def add_double_space_before_brace(code: str) -> str:
     """Add double space before opening brace in function/constructor declarations"""
-    result = []
-    for line in lines:
-        # Match lines that end with ) { and add extra space
-        if line.strip().endswith(") {"):
-            result.append(line[:-2] + "  {")
-        else:
-            result.append(line)
-    return result
+    # Line-local, so one substitution over the joined text covers every line
+    return BRACE_PATTERN.sub(")  {", code)
 
 
-def format_solidity(code: str) -> str:
-    """Main entry point for formatting Solidity code"""
-    # Run forge fmt first
-    formatted_code = run_forge_fmt(code)
+@lru_cache(maxsize=256)
+def format_pipeline(formatted_code: str) -> str:
+    """Apply the formatting pipeline to forge fmt output"""
+    # Shorten uint256 over the whole source at once
+    formatted_code = convert_uint256_to_uint(formatted_code)
 
     # Convert to lines for processing
     lines = formatted_code.split("\n")
 
-    # Apply formatting pipeline
+    # Skip every pass whose trigger text never occurs in the source
+    def needed(trigger: Optional[str]) -> bool:
+        return trigger is None or trigger in formatted_code
+
+    # Apply formatting pipeline, starting with the passes that add lines
     transformations = [
-        convert_uint256_to_uint,
-        format_import_statements,
-        format_variable_declarations,
-        format_function_declarations,
-        format_constructors,
-        format_require_statements,
-        format_struct_assignments,
-        format_variable_assignments,
-        add_double_space_before_brace,
+        (None, format_declarations),
+        ("function", format_function_declarations),
+        ("constructor(", format_constructors),
     ]
 
-    for transform in transformations:
-        lines = transform(lines)
+    for trigger, transform in transformations:
+        if needed(trigger):
+            lines = transform(lines)
 
-    # Convert back to string and preserve trailing newlines
+    # The remaining passes keep every line in place and of the same kind,
+    # so the lines are classified once and shared between them
+    classified_transformations = [
+        ("require(", format_require_statements),
+        (":", format_struct_assignments),
+        ("=", format_variable_assignments),
+    ]
+    classified_transformations = [
+        transform
+        for trigger, transform in classified_transformations
+        if needed(trigger)
+    ]
+
+    if classified_transformations:
+        kinds = classify_lines(lines)
+        for transform in classified_transformations:
+            lines = transform(lines, kinds)
+
+    # Convert back to string, finishing with the line-local brace spacing
     result = "\n".join(lines)
+    if needed(") {"):
+        result = add_double_space_before_brace(result)
+
+    return result
+
+
+def format_forge_output(code: str, formatted_code: str) -> str:
+    """Apply the formatting pipeline on top of forge fmt output for code"""
+    # The pipeline is cached on the forge fmt output, so sources that only
+    # differ in what forge fmt normalizes share one run
+    result = format_pipeline(formatted_code)
+
+    # Preserve trailing newlines
     return preserve_trailing_newline(code, result)
+
+
+def format_solidity(code: str) -> str:
+    """Main entry point for formatting Solidity code"""
+    # Run forge fmt first
+    return format_forge_output(code, run_forge_fmt(code))
+
+
+def format_solidity_many(codes: List[str]) -> List[str]:
+    """Format several sources, sharing one forge fmt run across the batch"""
+    formatted_codes = run_forge_fmt_many(codes)
+    return [
+        format_forge_output(code, formatted_code)
+        for code, formatted_code in zip(codes, formatted_codes)
+    ]
@@ -1,28 +1,98 @@
+import os
 import sys
+import tempfile
 from pathlib import Path
-from .formatter import format_solidity
+from typing import List, Tuple
+from .formatter import format_solidity_many
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: shafu <file.sol> [--write]")
-        sys.exit(1)
+def write_atomically(file_path: Path, content: str) -> None:
+    """Replace file_path with content without ever leaving it half written"""
+    # Replace the file a symlink points to, not the link itself
+    file_path = file_path.resolve()
+
+    # A hidden sibling file, so the final rename stays on one filesystem
+    try:
+        fd, temp_path = tempfile.mkstemp(
+            dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp"
+        )
+    except OSError:
+        # No temporary file allowed next to it, e.g. a read-only directory
+        file_path.write_text(content)
+        return
+
+    try:
+        with os.fdopen(fd, "w") as temp_file:
+            temp_file.write(content)
+
+        # mkstemp creates the file as 0600 for the current user, so carry
+        # over the original permissions and, where allowed, owner and group
+        original = file_path.stat()
+        os.chmod(temp_path, original.st_mode & 0o7777)
+        if hasattr(os, "chown"):
+            try:
+                os.chown(temp_path, original.st_uid, original.st_gid)
+            except PermissionError:
+                pass
+
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+USAGE = "Usage: shafu <file.sol> [<file.sol> ...] [--write]"
 
-    file_path = Path(sys.argv[1])
-    write_mode = "--write" in sys.argv
 
-    if not file_path.exists():
-        print(f"Error: {file_path} not found")
+def parse_args(args: List[str]) -> Tuple[List[Path], bool]:
+    """Split the command line into the files to format and the write flag"""
+    file_paths = []
+    write_mode = False
+
+    for arg in args:
+        if arg == "--write":
+            write_mode = True
+        elif arg.startswith("--"):
+            # Unknown or mistyped flag, e.g. --wirte
+            print(f"Error: unknown option {arg}")
+            print(USAGE)
+            sys.exit(1)
+        else:
+            file_paths.append(Path(arg))
+
+    if not file_paths:
+        print(USAGE)
         sys.exit(1)
 
-    content = file_path.read_text()
-    formatted = format_solidity(content)
+    return file_paths, write_mode
+
+
+def main():
+    file_paths, write_mode = parse_args(sys.argv[1:])
+
+    for file_path in file_paths:
+        if not file_path.exists():
+            print(f"Error: {file_path} not found")
+            sys.exit(1)
+
+    # Format all files together so forge runs once for the whole batch
+    contents = [file_path.read_text() for file_path in file_paths]
+    formatted_contents = format_solidity_many(contents)
+
+    for file_path, content, formatted in zip(file_paths, contents, formatted_contents):
+        if write_mode:
+            # Leave already formatted files untouched, mtime included
+            if formatted == content:
+                print(f"Unchanged {file_path}")
+                continue
 
-    if write_mode:
-        file_path.write_text(formatted)
-        print(f"Formatted {file_path}")
-    else:
-        print(formatted)
+            write_atomically(file_path, formatted)
+            print(f"Formatted {file_path}")
+        else:
+            # Label each file so output for several files can be told apart
+            if len(file_paths) > 1:
+                print(f"// {file_path}")
+            print(formatted)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,10 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.26;
+
+contract Escrow {
+    function fund() {
+        require((amount + 1) >= minDeposit(receiver, 1), Errors.MIN_DEPOSIT);
+        require(balanceOf[receiver] + amount <= cap, Errors.CAP_EXCEEDED);
+        require(check(a, b), Errors.CHECK_FAILED);
+    }
+}
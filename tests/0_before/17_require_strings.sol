@@ -0,0 +1,10 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.26;
+
+contract Escrow {
+    function fund() {
+        require(amount > 0, "amount, too low");
+        require(bytes(name).length != 0, "name (empty)");
+        require(keccak256(bytes(tag)) == TAG_HASH, "tag <= limit");
+    }
+}
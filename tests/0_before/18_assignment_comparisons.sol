@@ -0,0 +1,16 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.26;
+
+contract Escrow {
+    function fund()  {
+        uint distributionId = distributionIds[i];
+        bool isOwner = owner == msg.sender;
+        owner == msg.sender;
+        string memory note = "fee=0";
+        if (amount <= limit) { total = amount; }
+        total = amount; // total == amount
+        claimed = true;
+        count += 2;
+        fee -= 1;
+    }
+}
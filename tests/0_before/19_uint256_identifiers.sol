@@ -0,0 +1,16 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.26;
+
+contract Escrow {
+    uint256 public total;
+    uint256 public maxUint256;
+    // uint256 public commented;
+    mapping(address => uint256) public balances;
+
+    function fund(uint256 amount)  {
+        uint256 uint256Count = amount;
+        uint256 myuint256 = amount;
+
+        total = toUint256(amount);
+    }
+}
@@ -0,0 +1,12 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.26;
+
+contract Router {
+    function route(uint256 amount, function(uint256, uint256) external returns (uint256) hook) public {
+        hook(amount, 0);
+    }
+
+    function swap(uint256 amount, function(uint256, uint256) external hook, address to) external {
+        hook(amount, 0);
+    }
+}
@@ -0,0 +1,16 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.26;
+
+contract Escrow {
+    uint public total;
+    uint public maxUint256;
+    // uint256 public commented;
+    mapping(address => uint) public balances;
+
+    function fund(uint amount)  {
+        uint uint256Count = amount;
+        uint myuint256    = amount;
+
+        total = toUint256(amount);
+    }
+}
@@ -0,0 +1,17 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.26;
+
+contract Keys {
+    function rotate(bytes32 key) onlyPublicSigner returns (bytes32 publicKey)  {
+        return key;
+    }
+
+    function read(bytes32 key)
+        external
+        view
+        returns
+        (bytes32)
+    {
+        return key;
+    }
+}
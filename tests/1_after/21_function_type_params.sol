@@ -0,0 +1,20 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.26;
+
+contract Router {
+    function route(uint amount, function(uint, uint) external returns (uint) hook)
+        public
+    {
+        hook(amount, 0);
+    }
+
+    function swap(
+        uint amount,
+        function(uint, uint) external hook,
+        address to
+    )
+        external
+    {
+        hook(amount, 0);
+    }
+}
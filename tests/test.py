@@ -5,7 +5,7 @@ import sys
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from src.shafu_formatter.formatter import format_solidity
+from src.shafu_formatter.formatter import format_solidity_many
 
 
 def test_all():
@@ -16,6 +16,7 @@ def test_all():
 
     passed = 0
     failed = 0
+    cases = []
 
     for before_file in sorted(before_dir.glob("*")):
         if before_file.is_file():
@@ -26,18 +27,24 @@ def test_all():
                 failed += 1
                 continue
 
-            input_content = before_file.read_text()
-            expected_content = after_file.read_text()
-            result = format_solidity(input_content)
-
-            if result.strip() == expected_content.strip():
-                print(f"✅ {before_file.name}")
-                passed += 1
-            else:
-                print(f"❌ {before_file.name} - FAILED")
-                print(f"Expected:\n{expected_content}")
-                print(f"Got:\n{result}")
-                failed += 1
+            cases.append((before_file, after_file))
+
+    # Format every input together so forge runs once for the whole suite
+    results = format_solidity_many(
+        [before_file.read_text() for before_file, _ in cases]
+    )
+
+    for (before_file, after_file), result in zip(cases, results):
+        expected_content = after_file.read_text()
+
+        if result.strip() == expected_content.strip():
+            print(f"✅ {before_file.name}")
+            passed += 1
+        else:
+            print(f"❌ {before_file.name} - FAILED")
+            print(f"Expected:\n{expected_content}")
+            print(f"Got:\n{result}")
+            failed += 1
 
     print(f"\n{passed} passed, {failed} failed")
     return failed == 0